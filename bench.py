@@ -0,0 +1,300 @@
+""" host compiled microbenchmark for interpreted sketches.
+    python bench.py sketches/*.txt --timing millis timer1 --ticks 2000000
+    numbers are for comparing codegen on the host, unsigned long is 64 bit here so they are not avr cycle counts """
+
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import tempfile
+
+from main import Interpreter
+
+ARDUINO_STUB = """
+#include <stdint.h>
+#define HIGH 1
+#define LOW 0
+#define INPUT 0
+#define OUTPUT 1
+#define INPUT_PULLUP 2
+#define F_CPU 16000000UL
+#define ISR(vector) void vector(void)
+#define WGM12 3
+#define CS10 0
+#define CS11 1
+#define OCIE1A 1
+#define WGM21 1
+#define CS22 2
+#define OCIE2A 1
+typedef uint8_t byte;
+typedef bool boolean;
+extern volatile unsigned long _bench_now_us;
+extern volatile uint8_t _bench_sink;
+extern volatile uint8_t TCCR1A, TCCR1B, TIMSK1, TCCR2A, TCCR2B, TCNT2, OCR2A, TIMSK2;
+extern volatile uint16_t TCNT1, OCR1A;
+static inline unsigned long millis(void) { return _bench_now_us / 1000; }
+static inline unsigned long micros(void) { return _bench_now_us; }
+static inline void pinMode(uint8_t pin, uint8_t mode) { _bench_sink ^= pin ^ mode; }
+static inline void digitalWrite(uint8_t pin, uint8_t val) { _bench_sink ^= pin ^ val; }
+static inline int digitalRead(uint8_t pin) { return (_bench_sink >> (pin & 7)) & 1; }
+static inline void noInterrupts(void) {}
+static inline void interrupts(void) {}
+"""
+
+HARNESS_MAIN = """
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+volatile unsigned long _bench_now_us = 0;
+volatile uint8_t _bench_sink = 0;
+volatile uint8_t TCCR1A, TCCR1B, TIMSK1, TCCR2A, TCCR2B, TCNT2, OCR2A, TIMSK2;
+volatile uint16_t TCNT1, OCR1A;
+static unsigned char _bench_isr_div = 0;
+
+static inline void _bench_advance(int isr) {{
+    unsigned long before = _bench_now_us / 1000;
+    _bench_now_us += {step_us};
+    if (isr) {{
+        for (unsigned long passed = _bench_now_us / 1000 - before; passed > 0; passed--) {{ {tick_isr} }}
+    }}
+}}
+
+static double _bench_run(void (*fn)(void), unsigned long ticks, int isr) {{
+    struct timespec a, b;
+    clock_gettime(CLOCK_MONOTONIC, &a);
+    for (unsigned long i = 0; i < ticks; i++) {{ _bench_advance(isr); fn(); }}
+    clock_gettime(CLOCK_MONOTONIC, &b);
+    return ((b.tv_sec - a.tv_sec) * 1e9 + (b.tv_nsec - a.tv_nsec)) / ticks;
+}}
+
+static void _bench_empty(void) {{}}
+
+static void _bench_reset(void) {{
+    _bench_now_us = 0;
+    _bench_isr_div = 0;
+    {resets}
+}}
+
+static double _bench_sample(void (*fn)(void), int isr) {{
+    _bench_reset();
+    setup();
+    return _bench_run(fn, {ticks}UL, isr);
+}}
+
+{thread_funcs}
+
+int main(int argc, char **argv) {{
+    // empty and target samples are interleaved in one process, so drift of the machine hits both alike.
+    // every sample starts from the initial globals, setup() and the clock at 0
+    void (*fn)(void) = 0;
+    if (argc < 2) return 2;
+    else if (strcmp(argv[1], "loop") == 0) fn = loop;
+    {thread_select}else return 2;
+    _bench_sample(_bench_empty, 0);     // warm up
+    for (int r = 0; r < {repeats}; r++) {{
+        double empty, ns;
+        if (r % 2 == 0) {{ empty = _bench_sample(_bench_empty, 0); ns = _bench_sample(fn, 1); }}
+        else {{ ns = _bench_sample(fn, 1); empty = _bench_sample(_bench_empty, 0); }}
+        printf("%f %f\\n", empty, ns);
+    }}
+    return 0;
+}}
+"""
+
+
+class BenchResult:
+    def __init__(self, sketch, config, ns_per_tick=None, ns_spread=None, thread_ns=None, thread_spread=None, sections=None, error=""):
+        self.sketch = sketch
+        self.config = config
+        self.ns_per_tick = ns_per_tick      # medians, the spread is max - min over the processes
+        self.ns_spread = ns_spread
+        self.thread_ns = thread_ns if thread_ns is not None else {}
+        self.thread_spread = thread_spread if thread_spread is not None else {}
+        self.sections = sections if sections is not None else {}
+        self.error = error
+
+    def to_dict(self):
+        return {"sketch": self.sketch, "config": self.config, "ns_per_tick": self.ns_per_tick, "ns_spread": self.ns_spread,
+                "thread_ns": self.thread_ns, "thread_spread": self.thread_spread, "sections": self.sections, "error": self.error}
+
+
+def within_noise(ns, spread) -> bool:
+    return ns <= spread
+
+
+class Bench:
+    def __init__(self, ticks=1000000, step_us=50, repeats=5, processes=7, cxx="", cflags="-Os"):
+        self.ticks = ticks
+        self.repeats = repeats
+        self.processes = processes
+        self.step_us = step_us
+        self.cxx = cxx or os.environ.get("CXX", "c++")
+        self.cflags = cflags.split()
+        self.regex_loop_body = "void loop\(\)( )*\{(.*)\}( )*$"
+        self.regex_thread_call = "(_f[0-9_]+)\(\);"
+        # top level declarations of the translator's own globals, every bit of sketch state lives in these
+        self.regex_global_declaration = "(?:^|(?<=;)|(?<=\}))( )*(?:volatile )?[a-zA-Z_][a-zA-Z0-9_ ]*? (_(?:mt0|mtick|mtick_div|[tcrlvi][0-9_]+(?:_c)?))( )*=( )*([^;{}]+);"
+
+    def tick_isr(self, timing, tick_ms) -> str:
+        # called once per scripted millisecond, like the hardware would
+        if timing == "timer2":
+            return "TIMER2_COMPA_vect();"
+        elif timing == "timer1":
+            return f"if (++_bench_isr_div >= {tick_ms}) {{ _bench_isr_div = 0; TIMER1_COMPA_vect(); }}"
+        return ""
+
+    def global_resets(self, code: str) -> str:
+        declarations = code.split(" void _f", 1)[0]
+        return " ".join(f"{m.group(2)} = {m.group(5).strip()};" for m in re.finditer(self.regex_global_declaration, declarations))
+
+    def render_harness(self, code: str, timing: str, tick_ms: int) -> str:
+        loop_body = re.search(self.regex_loop_body, code).group(2)
+        thread_calls = re.findall(self.regex_thread_call, loop_body)
+        thread_funcs = ""
+        thread_select = ""
+        for n, func_name in enumerate(thread_calls):
+            # the loop body with every other thread call removed, so the main timer update stays in
+            body = re.sub(self.regex_thread_call, lambda m: m.group() if m.group(1) == func_name else "", loop_body)
+            thread_funcs += f"static void _bench_thread_{n}(void) {{ {body} }}\n"
+            thread_select += f'else if (strcmp(argv[1], "{func_name}") == 0) fn = _bench_thread_{n};\n    '
+        return HARNESS_MAIN.format(step_us=self.step_us, tick_isr=self.tick_isr(timing, tick_ms), ticks=self.ticks,
+                                   repeats=self.repeats, resets=self.global_resets(code), thread_funcs=thread_funcs, thread_select=thread_select)
+
+    def measure(self, exe: str, targets: list[str]) -> tuple[dict, str]:
+        # (target - empty) of the interleaved pairs, median per process. the same binary lands in a fast or a slow
+        # mode per process, so several processes are run, round robin over the targets so they all see the same
+        # machine, and the spread of the process medians is the noise. returns target -> (median, spread)
+        medians = {t: [] for t in targets}
+        for _ in range(self.processes):
+            for target in targets:
+                proc = subprocess.run([exe, target], capture_output=True, text=True)
+                if proc.returncode != 0:
+                    return {}, f"{target} exited with {proc.returncode}"
+                samples = []
+                for line in proc.stdout.splitlines():
+                    empty, ns = (float(i) for i in line.split())
+                    samples.append(ns - empty)
+                medians[target].append(statistics.median(samples))
+        return {t: (statistics.median(m), max(m) - min(m)) for t, m in medians.items()}, ""
+
+    def section_sizes(self, obj_path: str) -> dict[str: int]:
+        if shutil.which("size") is None:
+            return {}
+        out = subprocess.run(["size", "-A", obj_path], capture_output=True, text=True, check=True).stdout
+        res = {".text": 0, ".data": 0, ".bss": 0}
+        for line in out.splitlines():
+            parts = line.split()
+            if len(parts) < 2 or not parts[1].isdigit():
+                continue
+            for sec in res:
+                if parts[0] == sec or parts[0].startswith(sec + "."):
+                    res[sec] += int(parts[1])
+        return res
+
+    def run(self, sketch_path: str, timing="millis", tick_ms=1, workers=None) -> BenchResult:
+        config = timing if timing == "millis" else f"{timing}/{tick_ms}ms"
+        sketch = os.path.basename(sketch_path)
+        with open(sketch_path) as f:
+            src = f.read()
+        try:
+            code = Interpreter(timing=timing, tick_ms=tick_ms).interpret(src, workers=workers)
+        except Exception as e:
+            return BenchResult(sketch, config, error=f"interpret failed: {e!r}")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "Arduino.h"), "w") as f:
+                f.write(ARDUINO_STUB)
+            with open(os.path.join(tmp, "sketch.cpp"), "w") as f:
+                f.write(f'#include "Arduino.h"\n{code}\n')
+            with open(os.path.join(tmp, "harness.cpp"), "w") as f:
+                f.write(f'#include "sketch.cpp"\n{self.render_harness(code, timing, tick_ms)}')
+            # sizes come from the sketch alone, the harness is built separately so it doesnt pollute them
+            obj = os.path.join(tmp, "sketch.o")
+            exe = os.path.join(tmp, "harness")
+            build = subprocess.run([self.cxx, *self.cflags, "-c", "sketch.cpp", "-o", obj], cwd=tmp, capture_output=True, text=True)
+            if build.returncode == 0:
+                build = subprocess.run([self.cxx, *self.cflags, "harness.cpp", "-o", exe], cwd=tmp, capture_output=True, text=True)
+            if build.returncode != 0:
+                errors = [line for line in build.stderr.splitlines() if "error:" in line]
+                return BenchResult(sketch, config, error=errors[0].strip() if errors else "compile failed")
+            sections = self.section_sizes(obj)
+
+            res = BenchResult(sketch, config, sections=sections)
+            targets = ["loop", *re.findall(self.regex_thread_call, re.search(self.regex_loop_body, code).group(2))]
+            measured, error = self.measure(exe, targets)
+            if error:
+                return BenchResult(sketch, config, sections=sections, error=error)
+            for target, (ns, spread) in measured.items():
+                if target == "loop":
+                    res.ns_per_tick, res.ns_spread = ns, spread
+                else:
+                    res.thread_ns[target], res.thread_spread[target] = ns, spread
+        return res
+
+
+def format_results(results: list[BenchResult], baseline: list[dict] = None) -> str:
+    base = {(b["sketch"], b["config"]): b for b in (baseline or [])}
+    rows = [("sketch", "config", "ns/tick", "delta", ".text", ".bss", "slowest thread")]
+    for r in results:
+        if r.error:
+            rows.append((r.sketch, r.config, "error", "", "", "", r.error))
+            continue
+        if within_noise(r.ns_per_tick, r.ns_spread):
+            ns = f"< noise ({r.ns_spread:.2f})"
+        else:
+            ns = f"{r.ns_per_tick:.2f} ±{r.ns_spread / 2:.2f}"
+        delta = ""
+        b = base.get((r.sketch, r.config))
+        # a difference the two runs' spreads together could explain is not a change
+        if b is not None and b.get("ns_per_tick") and abs(r.ns_per_tick - b["ns_per_tick"]) > r.ns_spread + (b.get("ns_spread") or 0):
+            delta = f"{(r.ns_per_tick - b['ns_per_tick']) / b['ns_per_tick'] * 100:+.1f}%"
+        threads = sorted(r.thread_ns.items(), key=lambda x: x[1], reverse=True)
+        slowest = ""
+        if len(threads) > 0 and within_noise(threads[0][1], r.thread_spread[threads[0][0]]):
+            slowest = "all < noise"
+        elif len(threads) > 1 and threads[0][1] - threads[1][1] <= r.thread_spread[threads[0][0]] + r.thread_spread[threads[1][0]]:
+            slowest = "tie within noise"
+        elif len(threads) > 0:
+            slowest = f"{threads[0][0]} {threads[0][1]:.2f}ns"
+        rows.append((r.sketch, r.config, ns, delta, str(r.sections.get(".text", "")), str(r.sections.get(".bss", "")), slowest))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip() for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark interpreted sketches on the host")
+    parser.add_argument("sketches", nargs="+")
+    parser.add_argument("--timing", nargs="+", default=["millis"], choices=["millis", "timer1", "timer2"])
+    parser.add_argument("--tick-ms", type=int, default=1)
+    parser.add_argument("--ticks", type=int, default=1000000)
+    parser.add_argument("--step-us", type=int, default=50, help="scripted clock advance per loop() tick")
+    parser.add_argument("--repeats", type=int, default=5, help="empty / target pairs per process")
+    parser.add_argument("--processes", type=int, default=7, help="processes per measurement, the median is reported")
+    parser.add_argument("--cxx", default="")
+    parser.add_argument("--cflags", default="-Os")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", default="", help="write results here")
+    parser.add_argument("--baseline", default="", help="json from an earlier run to compare against")
+    args = parser.parse_args()
+
+    bench = Bench(ticks=args.ticks, step_us=args.step_us, repeats=args.repeats, processes=args.processes, cxx=args.cxx, cflags=args.cflags)
+    results = []
+    for sketch_path in args.sketches:
+        for timing in args.timing:
+            results.append(bench.run(sketch_path, timing=timing, tick_ms=args.tick_ms, workers=args.workers))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(format_results(results, baseline))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([r.to_dict() for r in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
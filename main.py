@@ -1,4 +1,5 @@
 import re
+from concurrent.futures import ProcessPoolExecutor
 from typing import Match, Union
 
 
@@ -72,7 +73,18 @@ class lang_token:
         
 
 class Interpreter:
-    def __init__(self):
+    def __init__(self, namespace="", timing="millis", tick_ms=1):
+        # timing: "millis" reads millis() every loop(), "timer1" / "timer2" count ticks of tick_ms in a compare-match ISR
+        # (the timer is taken over: timer1 breaks Servo and analogWrite on pins 9/10, timer2 breaks tone() and analogWrite on pins 3/11)
+        if timing not in ("millis", "timer1", "timer2"):
+            raise ValueError(f"unknown timing backend: {timing}")
+        if not 1 <= tick_ms <= 255:
+            raise ValueError(f"tick_ms must be between 1 and 255, got {tick_ms}")
+        self.timing = timing
+        self.tick_ms = tick_ms
+        self.timer_type = "unsigned long" if timing == "millis" else "_tick_t"
+        self.sleep_tick_targets = []    # constant sleep targets in ticks, None when not constant
+        self.namespace = namespace      # prefix for generated ids, keeps names unique when threads are translated apart
         self.variable_refs = []
         self.user_custom_variables = ParsedDeclaration()
         self.default_var_value = 0
@@ -86,6 +98,7 @@ class Interpreter:
         self.new_loop_var_id = 0
         self.new_str_swap_id = 0
         self.main_timer = "_mt0"
+        self.tick_counter = "_mtick"
         self.NewVar = self.generate_variable()
         self.NewTimer = self.generate_variable(is_timer=True)
         self.NewCond = self.generate_variable(is_condition=True)
@@ -115,28 +128,28 @@ class Interpreter:
     def generate_variable(self, is_timer=False, is_condition=False, is_routine=False, is_func=False, is_iterator=False, is_loop_var=False, is_str_swap=False):
         while True:
             if is_timer:
-                yield f"_t{self.new_timer_id}"
+                yield f"_t{self.namespace}{self.new_timer_id}"
                 self.new_timer_id += 1
             elif is_condition:
-                yield f"_c{self.new_cond_id}"
+                yield f"_c{self.namespace}{self.new_cond_id}"
                 self.new_cond_id += 1
             elif is_routine:
-                yield f"_r{self.new_routine_id}"
+                yield f"_r{self.namespace}{self.new_routine_id}"
                 self.new_routine_id += 1
             elif is_func:
-                yield f"_f{self.new_func_id}"
+                yield f"_f{self.namespace}{self.new_func_id}"
                 self.new_func_id += 1
             elif is_iterator:
-                yield f"_i{self.new_iter_id}"
+                yield f"_i{self.namespace}{self.new_iter_id}"
                 self.new_iter_id += 1
             elif is_loop_var:
-                yield f"_l{self.new_loop_var_id}"
+                yield f"_l{self.namespace}{self.new_loop_var_id}"
                 self.new_loop_var_id += 1
             elif is_str_swap:
                 yield f"{self.new_str_swap_id}"
                 self.new_str_swap_id += 1
             else:
-                yield f"_v{self.new_var_id}"
+                yield f"_v{self.namespace}{self.new_var_id}"
                 self.new_var_id += 1
 
     def declare(self, s, vartype="int", val="0") -> str:
@@ -335,15 +348,34 @@ class Interpreter:
             cmd_scopes.insert(0, initial_code)  # inserting it at position 0 becuase its the first :-)
         return cmd_scopes
 
+    def sleep_ticks(self, sleep_target: str) -> Union[int, None]:
+        # rounds up, plus one tick when tick_ms > 1 because the start is only known to the tick it fell in,
+        # so a sleep never ends early. None if the target is only known at runtime
+        if re.fullmatch("[0-9]+[uUlL]*", sleep_target) is None:
+            return None
+        return -(-int(re.sub("[uUlL]", "", sleep_target)) // self.tick_ms) + (1 if self.tick_ms > 1 else 0)
+
     def translate_sleep(self, sleep_token: lang_token, content_str:str, parent_str="", sd=scope_data) -> tuple[str, str, str]:  
         declaration = ""
 
         sleep_timer = next(self.NewTimer)
         sleep_timer_checker = f"{sleep_timer}_c"
-        sleep_timer_declare = self.declare(sleep_timer, vartype="unsigned long")
+        sleep_timer_declare = self.declare(sleep_timer, vartype=self.timer_type)
         sleep_timer_checker_declare = self.declare(sleep_timer_checker, vartype="unsigned char",val="0")
         sleep_timer_target = sleep_token.actual_repr(parent_str).replace(";", "").strip()[6:-1]
-        timer_template = f"if ({sleep_timer_checker} == 0) {{ {sleep_timer} = {self.main_timer}; {sleep_timer_checker} = 1; }} if ({self.main_timer} - {sleep_timer} >= {sleep_timer_target}) {{ {content_str} }} else {{ return; }} "
+        if self.timing == "millis":
+            timer_template = f"if ({sleep_timer_checker} == 0) {{ {sleep_timer} = {self.main_timer}; {sleep_timer_checker} = 1; }} if ({self.main_timer} - {sleep_timer} >= {sleep_timer_target}) {{ {content_str} }} else {{ return; }} "
+        else:
+            ticks = self.sleep_ticks(sleep_timer_target)
+            self.sleep_tick_targets.append(ticks)
+            if ticks is not None:
+                tick_target = ticks
+            elif self.tick_ms == 1:
+                tick_target = sleep_timer_target
+            else:
+                tick_target = f"(({sleep_timer_target}) + {self.tick_ms - 1}) / {self.tick_ms} + 1"
+            # checker goes to 2 once elapsed, so a finished sleep is never compared again and cant be undone by tick wraparound
+            timer_template = f"if ({sleep_timer_checker} == 0) {{ {sleep_timer} = {self.main_timer}; {sleep_timer_checker} = 1; }} if ({sleep_timer_checker} == 1 && (_tick_t)({self.main_timer} - {sleep_timer}) >= {tick_target}) {{ {sleep_timer_checker} = 2; }} if ({sleep_timer_checker} == 2) {{ {content_str} }} else {{ return; }} "
         
         self.variable_refs.extend([sleep_timer, sleep_timer_checker])
         sd.add_refs(ref_reset_dict={sleep_timer: self.main_timer, sleep_timer_checker: self.default_var_value})
@@ -655,14 +687,67 @@ class Interpreter:
         self.variable_refs = []     # emptying the refs before starting another thread scope
         return v_dec, f_dec, func_name
 
+    def _translate_thread(self, tkn: lang_token, parent_str="") -> tuple[str, str, str, list]:
+        v_dec, f_dec, func_name = self._interpret_thread(tkn, parent_str=parent_str)
+        v_dec += self.user_custom_variables.get_dec()
+        for oldvar, newvar in self.custom_var_declaration(self.user_custom_variables).items():
+            v_dec = self.sub_var(v_dec, oldvar, newvar)
+            f_dec = self.sub_var(f_dec, oldvar, newvar)
+        self.user_custom_variables = ParsedDeclaration()        # clearing custom vars before interpreting next thread
+        sleep_tick_targets = self.sleep_tick_targets
+        self.sleep_tick_targets = []
+        return v_dec, f_dec, func_name, sleep_tick_targets
+
+    def tick_type(self) -> str:
+        # 16 bit ticks only when every sleep target is a constant that fits in half the range,
+        # the other half is headroom for a slow loop() before the elapsed count wraps and the sleep is missed
+        if all(t is not None and t <= 0x7FFF for t in self.sleep_tick_targets):
+            return "uint16_t"
+        return "uint32_t"
+
+    def _tick_source(self) -> tuple[str, str]:
+        if self.timing == "timer1":
+            init = f"TCCR1A = 0; TCCR1B = (1 << WGM12) | (1 << CS11) | (1 << CS10); TCNT1 = 0; OCR1A = (F_CPU / 64000UL) * {self.tick_ms} - 1; TIMSK1 |= (1 << OCIE1A);"
+            isr = f"ISR(TIMER1_COMPA_vect) {{ {self.tick_counter}++; }}"
+            declaration = ""
+        else:   # timer2 is 8 bit, so it always fires every 1ms and the isr divides down to tick_ms
+            init = "TCCR2A = (1 << WGM21); TCCR2B = (1 << CS22); TCNT2 = 0; OCR2A = F_CPU / 64000UL - 1; TIMSK2 |= (1 << OCIE2A);"
+            if self.tick_ms == 1:
+                isr = f"ISR(TIMER2_COMPA_vect) {{ {self.tick_counter}++; }}"
+                declaration = ""
+            else:
+                isr = f"ISR(TIMER2_COMPA_vect) {{ if (++{self.tick_counter}_div >= {self.tick_ms}) {{ {self.tick_counter}_div = 0; {self.tick_counter}++; }} }}"
+                declaration = f"unsigned char {self.tick_counter}_div = 0; "
+        declaration = f"typedef {self.tick_type()} _tick_t; volatile _tick_t {self.tick_counter} = 0; {declaration}{isr}"
+        setup = f"noInterrupts(); {init} interrupts();"
+        return declaration, setup
+
     def _finalize(self, func_declaration, var_declaration, setup_code, main_loop_code, other_code):
-        update_main_timer = f"{self.main_timer} = millis(); "
-        declare_main_timer = f"unsigned long {self.main_timer} = 0;"
+        if self.timing == "millis":
+            update_main_timer = f"{self.main_timer} = millis(); "
+            declare_main_timer = f"unsigned long {self.main_timer} = 0;"
+        else:
+            tick_declaration, tick_setup = self._tick_source()
+            # snapshot with interrupts off, the isr may be halfway through a multi byte increment
+            update_main_timer = f"noInterrupts(); {self.main_timer} = {self.tick_counter}; interrupts(); "
+            declare_main_timer = f"{tick_declaration} _tick_t {self.main_timer} = 0;"
+            setup_code = f"{tick_setup} {setup_code}"
         # _sleep = "sleep(1); " if self.has_sleep else ""
         res = f"{other_code} {declare_main_timer} {var_declaration} {func_declaration} void setup() {{ {setup_code} }} void loop() {{ {update_main_timer} {main_loop_code} }}"
         return res
 
-    def interpret(self, txt: str) -> str:
+    def thread_settings(self) -> dict:
+        # everything a thread translation reads from self, so changes made after __init__ (main_timer, regexes ...)
+        # reach the per thread interpreters too, serial or not
+        settings = {"timing": self.timing, "tick_ms": self.tick_ms,
+                    "main_timer": self.main_timer, "default_var_value": self.default_var_value, "swp": self.swp}
+        for k, v in vars(self).items():
+            if k.startswith("regex_"):
+                settings[k] = v
+        return settings
+
+    def interpret(self, txt: str, workers=None) -> str:
+        """ workers > 1 translates the threads in a process pool, output is the same either way """
         txt = self.purify_input(txt)
         self.input_code = txt
 
@@ -672,17 +757,22 @@ class Interpreter:
         
         other_code, setup_scope, loop_scope = self.get_large_scopes(txt)
         thread_scopes = self.get_inner_scope(loop_scope, sd=scope_data())     # this scope_data is meaningless and im lazy
-        for tkn in thread_scopes:
-            v_dec, f_dec, func_name = self._interpret_thread(tkn, parent_str=loop_scope)
+        # every thread gets its own namespace up front, so they can be translated in any order (or process)
+        # only the thread's own text is sent, so a pool doesnt pickle the whole sketch once per thread
+        settings = self.thread_settings()
+        jobs = [(f"{n}_", tkn.actual_repr(loop_scope), settings) for n, tkn in enumerate(thread_scopes)]
+        if workers is not None and workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                translated = list(pool.map(_translate_thread_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+        else:
+            translated = [_translate_thread_job(j) for j in jobs]
+        self.sleep_tick_targets = []
+        for v_dec, f_dec, func_name, sleep_tick_targets in translated:      # map keeps thread order so merging is deterministic
             tex = f"{func_name}();"
-            v_dec += self.user_custom_variables.get_dec()
-            for oldvar, newvar in self.custom_var_declaration(self.user_custom_variables).items():
-                v_dec = self.sub_var(v_dec, oldvar, newvar)
-                f_dec = self.sub_var(f_dec, oldvar, newvar)
+            self.sleep_tick_targets.extend(sleep_tick_targets)
             func_declaration += f_dec
             var_declaration += v_dec
             main_loop_code += tex
-            self.user_custom_variables = ParsedDeclaration()        # clearing custom vars before interpreting next thread
 
         # sort decleration of vars
         sorted_d = var_declaration.strip().split(";")
@@ -699,6 +789,16 @@ class Interpreter:
         return result_code
 
 
+def _translate_thread_job(job) -> tuple[str, str, str, list]:
+    # module level so ProcessPoolExecutor can pickle it
+    namespace, thread_str, settings = job
+    interp = Interpreter(namespace=namespace, timing=settings["timing"], tick_ms=settings["tick_ms"])
+    for k, v in settings.items():
+        setattr(interp, k, v)
+    interp.input_code = thread_str
+    return interp._translate_thread(lang_token("parent", 0, len(thread_str), routineable=False), parent_str=thread_str)
+
+
 if __name__ == "__main__":
     inp = """
     void setup() {